@@ -2,6 +2,9 @@ import React, { useState, useRef, useEffect } from 'react';
 import { PotholeDetector } from './services/potholeDetector';
 import exifr from 'exifr';
 
+// Half-width in degrees of the area around the device shown on the background map
+const MAP_BBOX_RADIUS_DEG = 0.25;
+
 const App: React.FC = () => {
     const [detector, setDetector] = useState<PotholeDetector | null>(null);
     // UI state
@@ -38,6 +41,27 @@ const App: React.FC = () => {
         initializeModel();
     }, []);
 
+    // Point the background map at the area around the device so /api/map
+    // renders nearby reports instead of only the newest ones
+    useEffect(() => {
+        if (!navigator.geolocation) return;
+        navigator.geolocation.getCurrentPosition(
+            ({ coords }) => {
+                const frame = document.getElementById('map-background') as HTMLIFrameElement | null;
+                if (!frame) return;
+                // Rounded so nearby clients share a cached map on the backend
+                const bbox = [
+                    coords.longitude - MAP_BBOX_RADIUS_DEG,
+                    coords.latitude - MAP_BBOX_RADIUS_DEG,
+                    coords.longitude + MAP_BBOX_RADIUS_DEG,
+                    coords.latitude + MAP_BBOX_RADIUS_DEG,
+                ].map((v) => v.toFixed(2)).join(',');
+                frame.src = `/api/map?bbox=${bbox}`;
+            },
+            (err) => console.warn('Geolocation unavailable, showing newest reports:', err.message),
+        );
+    }, []);
+
     
 
     const handleFileChange = async (event: React.ChangeEvent<HTMLInputElement>) => {
@@ -1,17 +1,27 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Form, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.concurrency import run_in_threadpool
+from anyio import to_thread
 import folium  # type: ignore
+from folium.plugins import FastMarkerCluster, HeatMap  # type: ignore
 import asyncpg  # type: ignore
+import asyncio
+import gzip
 import os
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 import logging
+import math
+import operator
+import time
 from pydantic import BaseModel
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
 
 load_dotenv()
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 logging.basicConfig(level=logging.INFO)
 
 # Add CORS middleware with explicit origins (configurable via env)
@@ -26,23 +36,80 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large JSON responses. /api/map serves pre-compressed bytes with
+# Content-Encoding already set, which the middleware passes through untouched.
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=6)
+
 # NeonDB connection
 DATABASE_URL = os.getenv("NEON_DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("NEON_DATABASE_URL not set in environment variables")
 
+# Connection pool sizing (configurable via env). Every uvicorn worker owns a
+# pool, so the defaults split DB_CONNECTION_BUDGET across WEB_CONCURRENCY
+# workers (the variable uvicorn reads for --workers).
+WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+DB_CONNECTION_BUDGET = int(os.getenv("DB_CONNECTION_BUDGET", "100"))
+POOL_MAX = int(os.getenv("POOL_MAX", str(max(1, min(50, DB_CONNECTION_BUDGET // WORKERS)))))
+POOL_MIN = int(os.getenv("POOL_MIN", str(max(1, POOL_MAX // 5))))
+
+# Optional override for the worker thread pool used for map rendering
+THREADPOOL_SIZE = os.getenv("THREADPOOL_SIZE")
+
+REPORT_COLUMNS = ["latitude", "longitude", "pothole_count", "image_name"]
+_report_record = operator.attrgetter(*REPORT_COLUMNS)
+
+# Rendered /api/map pages keyed by (latest id, latest created_at, query args),
+# stored as (expiry time, (html, gzipped html)). Inserts only clear the cache of the worker that
+# handled them, so the TTL bounds staleness in the other workers.
+# (html, gzipped html) for one rendered map
+MapPage = Tuple[bytes, bytes]
+_map_cache: Dict[tuple, Tuple[float, MapPage]] = {}
+# In-flight renders per cache key so only identical cache misses share work
+_map_renders: Dict[tuple, "asyncio.Future[MapPage]"] = {}
+MAP_CACHE_MAX_ENTRIES = 32
+MAP_CACHE_TTL = float(os.getenv("MAP_CACHE_TTL", "30"))
+MAP_GZIP_LEVEL = 6
+
+# Default and maximum number of reports rendered by /api/map
+MAP_DEFAULT_LIMIT = 5000
+MAP_MAX_LIMIT = 20000
+
 
 @app.on_event("startup")
 async def init_db():
     """Initialize database connection pool on startup."""
     try:
-        app.state.pool = await asyncpg.create_pool(DATABASE_URL)
-        logging.info("Database pool initialized successfully")
+        app.state.pool = await asyncpg.create_pool(
+            DATABASE_URL,
+            min_size=POOL_MIN,
+            max_size=POOL_MAX,
+            max_inactive_connection_lifetime=300,
+            command_timeout=60,
+        )
+        logging.info(
+            f"Database pool initialized successfully "
+            f"(pid={os.getpid()}, workers={WORKERS}, min={POOL_MIN}, max={POOL_MAX})"
+        )
+        if WORKERS * POOL_MAX > DB_CONNECTION_BUDGET:
+            logging.warning(
+                f"{WORKERS} workers x POOL_MAX={POOL_MAX} exceeds "
+                f"DB_CONNECTION_BUDGET={DB_CONNECTION_BUDGET}"
+            )
     except Exception as e:
         logging.error(f"Failed to initialize database pool: {e}")
         raise
 
 
+@app.on_event("startup")
+async def configure_threadpool():
+    """Apply THREADPOOL_SIZE to the thread pool used by run_in_threadpool."""
+    limiter = to_thread.current_default_thread_limiter()
+    if THREADPOOL_SIZE:
+        limiter.total_tokens = int(THREADPOOL_SIZE)
+    logging.info(f"Thread pool size: {limiter.total_tokens} threads")
+
+
 @app.on_event("shutdown")
 async def close_db():
     """Close database connection pool on shutdown."""
@@ -53,7 +120,7 @@ async def close_db():
 
 @app.post("/api/report")
 async def report_pothole(
-    file: UploadFile = File(...),
+    image_name: str = Form(..., min_length=1),
     latitude: float = Form(...),
     longitude: float = Form(...),
     pothole_count: int = Form(...),
@@ -62,7 +129,7 @@ async def report_pothole(
     Store pothole detection report with GPS coordinates and image metadata.
     
     Args:
-        file: Image file from the client
+        image_name: File name of the analysed image
         latitude: GPS latitude coordinate
         longitude: GPS longitude coordinate
         pothole_count: Number of potholes detected
@@ -76,12 +143,6 @@ async def report_pothole(
             detail="No potholes detected"
         )
     
-    if not file.filename:
-        raise HTTPException(
-            status_code=400, 
-            detail="File name is required"
-        )
-    
     try:
         async with app.state.pool.acquire() as conn:
             await conn.execute(
@@ -92,8 +153,9 @@ async def report_pothole(
                 latitude,
                 longitude,
                 pothole_count,
-                file.filename,
+                image_name,
             )
+        _map_cache.clear()
         logging.info(
             f"Stored pothole report: lat={latitude}, lng={longitude}, count={pothole_count}"
         )
@@ -106,51 +168,223 @@ async def report_pothole(
         )
 
 
+# Leaflet callback building an emoji marker from a [lat, lng, count] row;
+# the divIcon is created once and shared by every marker
+MARKER_CALLBACK_JS = """
+(function () {
+    var icon = L.divIcon({
+        html: '<div style="font-size: 24pt; text-align: center;">🕳️</div>',
+        className: 'empty',
+        iconSize: [30, 30],
+        iconAnchor: [15, 15]
+    });
+    return function (row) {
+        var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+        marker.bindPopup('Potholes: ' + row[2]);
+        return marker;
+    };
+})()
+"""
+
+
+def _render_map(rows, center: Optional[Tuple[float, float]] = None) -> str:
+    """
+    Build the folium map for the given report rows and render it to HTML.
+
+    Args:
+        rows: Records with latitude, longitude and pothole_count
+        center: Optional (lat, lng) to show when there are no rows, such as
+            the middle of the requested bbox
+
+    Returns:
+        HTML representation of the folium map
+    """
+    # If no reports exist, show a default map
+    if not rows:
+        location = list(center) if center else [20.5937, 78.9629]
+        m = folium.Map(location=location, zoom_start=13 if center else 5)
+        folium.Marker(
+            location,
+            popup="No pothole reports yet",
+            icon=folium.Icon(color="gray"),
+        ).add_to(m)
+        logging.info("No pothole reports found, returning default map")
+        return m.get_root().render()
+
+    # Rows come back as (latitude, longitude, pothole_count); unpack
+    # positionally once and share the list between both layers
+    points = [[lat, lng, count] for lat, lng, count in rows]
+
+    # Center map on first report
+    initial_lat, initial_lng, _ = points[0]
+    m = folium.Map(location=[initial_lat, initial_lng], zoom_start=13)
+
+    # Heatmap weighted by the number of potholes in each report; Leaflet.heat
+    # clamps intensity at `max`, so scale it to the largest count shown
+    max_count = max(count for _, _, count in points)
+    HeatMap(points, radius=25, blur=15, max_zoom=1, max=max_count).add_to(m)
+
+    # Add emoji markers for each report as a single clustered JS array
+    FastMarkerCluster(points, callback=MARKER_CALLBACK_JS).add_to(m)
+
+    logging.info(f"Generated map with {len(rows)} pothole reports")
+    return m.get_root().render()
+
+
+def _parse_bbox(bbox: str) -> Tuple[float, float, float, float]:
+    """
+    Parse a Leaflet-style bounding box string.
+
+    Args:
+        bbox: "west,south,east,north" as produced by LatLngBounds.toBBoxString()
+
+    Returns:
+        Tuple of (west, south, east, north) coordinates
+    """
+    try:
+        west, south, east, north = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="bbox must be 'west,south,east,north'"
+        )
+    if not all(math.isfinite(v) for v in (west, south, east, north)):
+        raise HTTPException(
+            status_code=400,
+            detail="bbox coordinates must be finite numbers"
+        )
+    if south > north or west > east:
+        raise HTTPException(
+            status_code=400,
+            detail="bbox south/west must not exceed north/east"
+        )
+    return west, south, east, north
+
+
+def _build_map_page(rows, center: Optional[Tuple[float, float]]) -> MapPage:
+    """Render the map and gzip it once so cache hits never recompress."""
+    html = _render_map(rows, center).encode("utf-8")
+    return html, gzip.compress(html, compresslevel=MAP_GZIP_LEVEL)
+
+
+async def _render_and_cache(
+    cache_key: tuple, rows, center: Optional[Tuple[float, float]]
+) -> MapPage:
+    """Build the map page in a worker thread and store it in the cache."""
+    # folium rendering and gzip are CPU-bound; keep them off the event loop
+    page = await run_in_threadpool(_build_map_page, rows, center)
+    if len(_map_cache) >= MAP_CACHE_MAX_ENTRIES:
+        _map_cache.pop(next(iter(_map_cache)))
+    _map_cache[cache_key] = (time.monotonic() + MAP_CACHE_TTL, page)
+    return page
+
+
+def _get_cached_map(cache_key: tuple) -> Optional[MapPage]:
+    """Return the cached page for cache_key unless it is missing or expired."""
+    entry = _map_cache.get(cache_key)
+    if entry is None:
+        return None
+    expires_at, page = entry
+    if time.monotonic() >= expires_at:
+        _map_cache.pop(cache_key, None)
+        return None
+    return page
+
+
+def _map_response(request: Request, page: MapPage) -> Response:
+    """Serve the stored gzip bytes to clients that accept them."""
+    html, gzipped = page
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        return Response(
+            content=gzipped,
+            media_type="text/html",
+            headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+        )
+    return HTMLResponse(content=html, headers={"Vary": "Accept-Encoding"})
+
+
+def _start_render(
+    cache_key: tuple, rows, center: Optional[Tuple[float, float]]
+) -> "asyncio.Future[MapPage]":
+    """Start a render for cache_key and track it until it finishes."""
+    render = asyncio.ensure_future(_render_and_cache(cache_key, rows, center))
+    _map_renders[cache_key] = render
+
+    def _forget(_):
+        if _map_renders.get(cache_key) is render:
+            del _map_renders[cache_key]
+
+    render.add_done_callback(_forget)
+    return render
+
+
 @app.get("/api/map", response_class=HTMLResponse)
-async def get_map():
+async def get_map(
+    request: Request,
+    bbox: Optional[str] = None,
+    since: Optional[datetime] = None,
+    limit: int = Query(MAP_DEFAULT_LIMIT, ge=1, le=MAP_MAX_LIMIT),
+):
     """
-    Generate an interactive folium map with heatmap and markers for all pothole reports.
+    Generate an interactive folium map with heatmap and markers for pothole reports.
+
+    The rendered HTML is cached per query and (latest report id, latest report
+    time), and reused until a new report is stored or MAP_CACHE_TTL expires.
+
+    Args:
+        request: Incoming request, used for content negotiation
+        bbox: Optional "west,south,east,north" viewport to restrict reports to
+        since: Optional timestamp; only reports created at or after it are shown
+        limit: Maximum number of most recent reports to include
     
     Returns:
         HTML representation of the folium map
     """
+    conditions = []
+    args: List[Any] = []
+    center: Optional[Tuple[float, float]] = None
+    if bbox is not None:
+        west, south, east, north = _parse_bbox(bbox)
+        center = ((south + north) / 2, (west + east) / 2)
+        args.extend([south, north, west, east])
+        conditions.append("latitude BETWEEN $1 AND $2 AND longitude BETWEEN $3 AND $4")
+    if since is not None:
+        # created_at is a naive TIMESTAMP in the database TimeZone; compare
+        # against timestamptz so Postgres applies that zone. Naive values
+        # from the client are taken as UTC.
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        args.append(since)
+        conditions.append(f"created_at >= ${len(args)}::timestamptz")
+    args.append(limit)
+
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = (
+        "SELECT latitude, longitude, pothole_count FROM pothole_reports"
+        f"{where} ORDER BY created_at DESC LIMIT ${len(args)}"
+    )
+
     try:
         async with app.state.pool.acquire() as conn:
-            rows = await conn.fetch(
-                "SELECT latitude, longitude, pothole_count FROM pothole_reports ORDER BY created_at DESC"
+            stats = await conn.fetchrow(
+                "SELECT MAX(id) AS last_id, MAX(created_at) AS latest FROM pothole_reports"
             )
-        
-        # If no reports exist, show a default map
-        if not rows:
-            m = folium.Map(location=[20.5937, 78.9629], zoom_start=5)
-            folium.Marker(
-                [20.5937, 78.9629],
-                popup="No pothole reports yet",
-                icon=folium.Icon(color="gray"),
-            ).add_to(m)
-            logging.info("No pothole reports found, returning default map")
-            return m.get_root().render()
-
-        # Center map on first report
-        initial_lat = rows[0]["latitude"]
-        initial_lng = rows[0]["longitude"]
-        m = folium.Map(location=[initial_lat, initial_lng], zoom_start=13)
-
-        # Add emoji markers for each report
-        for row in rows:
-            icon = folium.DivIcon(
-                html='<div style="font-size: 24pt; text-align: center;">🕳️</div>',
-                icon_size=(30, 30),
-                icon_anchor=(15, 15)
-            )
-            folium.Marker(
-                location=[row["latitude"], row["longitude"]],
-                popup=f"Potholes: {row['pothole_count']}",
-                icon=icon
-            ).add_to(m)
+            cache_key = (stats["last_id"], stats["latest"], tuple(args))
+            cached = _get_cached_map(cache_key)
+            if cached is not None:
+                return _map_response(request, cached)
 
-        logging.info(f"Generated map with {len(rows)} pothole reports")
-        return m.get_root().render()
+            render = _map_renders.get(cache_key)
+            if render is None:
+                rows = await conn.fetch(query, *args)
+                render = _map_renders.get(cache_key)
+                if render is None:
+                    render = _start_render(cache_key, rows, center)
+
+        # Shield the shared render so one client disconnecting does not
+        # cancel it for the other requests waiting on the same key
+        page = await asyncio.shield(render)
+        return _map_response(request, page)
     except Exception as e:
         logging.error(f"Map generation error: {e}")
         raise HTTPException(
@@ -183,13 +417,14 @@ async def report_pothole_batch(payload: PotholeReportBatch):
     Returns:
         JSON response summarizing inserted rows
     """
-    # Filter invalid entries early to avoid partial inserts
-    valid_reports = [
-        r for r in payload.reports
+    # Filter invalid entries early to avoid partial inserts, building the
+    # COPY records in the same pass
+    records = [
+        _report_record(r) for r in payload.reports
         if r.pothole_count > 0
     ]
 
-    if not valid_reports:
+    if not records:
         raise HTTPException(
             status_code=400,
             detail="No valid reports to insert"
@@ -198,20 +433,16 @@ async def report_pothole_batch(payload: PotholeReportBatch):
     try:
         async with app.state.pool.acquire() as conn:
             async with conn.transaction():
-                await conn.executemany(
-                    """
-                    INSERT INTO pothole_reports (latitude, longitude, pothole_count, image_name)
-                    VALUES ($1, $2, $3, $4)
-                    """,
-                    [
-                        (r.latitude, r.longitude, r.pothole_count, r.image_name)
-                        for r in valid_reports
-                    ],
+                await conn.copy_records_to_table(
+                    "pothole_reports",
+                    records=records,
+                    columns=REPORT_COLUMNS,
                 )
-        logging.info(f"Stored batch of {len(valid_reports)} pothole reports")
+        _map_cache.clear()
+        logging.info(f"Stored batch of {len(records)} pothole reports")
         return {
             "status": "success",
-            "inserted": len(valid_reports),
+            "inserted": len(records),
             "total": len(payload.reports),
         }
     except Exception as e:
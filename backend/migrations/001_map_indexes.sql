@@ -0,0 +1,8 @@
+-- Indexes backing the /api/map query (ORDER BY created_at DESC LIMIT n and
+-- the optional bbox filter) on databases created before they were part of
+-- the schema. CONCURRENTLY avoids locking out inserts while the indexes
+-- build; run each statement outside a transaction block.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reports_created_at
+    ON pothole_reports (created_at DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reports_lat_lng
+    ON pothole_reports (latitude, longitude);